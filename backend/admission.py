@@ -0,0 +1,232 @@
+"""
+准入控制 - 保护调用识别模型的接口
+- 每个客户端一个令牌桶，限制请求速率（超限返回 429）
+- 全局限制同时进行的识别请求数量
+- 有界等待队列，队列已满时立即拒绝（返回 503）
+- 交互式上传优先于批量补录（backfill）
+所有时间（包括排队超时）都来自可注入的 clock，便于在测试中使用假时钟
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Callable, Optional
+
+# 优先级，数值越小越优先
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKFILL = 1
+
+
+class AdmissionRejected(Exception):
+    """请求被准入控制拒绝"""
+
+    def __init__(self, status_code: int, retry_after: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.detail = detail
+
+
+class TokenBucket:
+    """令牌桶：rate 为每秒补充的令牌数，capacity 为桶容量（允许的突发数量）"""
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        elapsed = max(now - self.updated, 0)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens: float = 1) -> float:
+        """
+        尝试取出令牌
+        - 成功返回 0
+        - 失败返回需要等待的秒数
+        """
+        self._refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return 0
+        if self.rate <= 0:
+            return math.inf
+        return (tokens - self.tokens) / self.rate
+
+    def is_full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+class AdmissionController:
+    """
+    识别请求的准入控制器
+    - max_in_flight: 同时进行的识别请求上限
+    - max_queue: 等待队列长度上限
+    - rate / burst: 每个客户端的令牌桶参数（每秒请求数 / 突发数量）
+    - max_wait: 在队列中的最长等待秒数（按 clock 计算），None 表示不限制
+    - max_tracked_clients: 最多保留的客户端令牌桶数量，超出时淘汰最久未使用的
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 4,
+        max_queue: int = 16,
+        rate: float = 10 / 60,
+        burst: float = 5,
+        max_wait: Optional[float] = 30,
+        default_service_time: float = 10,
+        max_tracked_clients: int = 10000,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.rate = rate
+        self.burst = burst
+        self.max_wait = max_wait
+        self.max_tracked_clients = max_tracked_clients
+        self.clock = clock
+
+        self.in_flight = 0
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        # 等待队列，元素为 (priority, seq, future, deadline)
+        self._queue = []
+        self._counter = itertools.count()
+        # 平均识别耗时（指数滑动平均），用于估算 Retry-After
+        self._avg_service_time = default_service_time
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for entry in self._queue if not entry[2].done())
+
+    def _bucket(self, client_id: str) -> TokenBucket:
+        """获取客户端的令牌桶，按最近使用顺序淘汰，数量不超过 max_tracked_clients"""
+        bucket = self._buckets.get(client_id)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.burst, self.clock)
+            self._buckets[client_id] = bucket
+            while len(self._buckets) > self.max_tracked_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client_id)
+        return bucket
+
+    def check_rate(self, client_id: str):
+        """检查客户端速率限制，超限时抛出 429"""
+        wait = self._bucket(client_id).try_acquire()
+        if wait > 0:
+            retry_after = max(1, math.ceil(wait)) if math.isfinite(wait) else 60
+            raise AdmissionRejected(429, retry_after, "请求过于频繁，请稍后再试")
+
+    def _retry_after(self) -> int:
+        """根据平均识别耗时和排队数量估算重试时间"""
+        waves = (self.queued + 1) / max(self.max_in_flight, 1)
+        return max(1, math.ceil(self._avg_service_time * waves))
+
+    def _overloaded(self, detail: str = "服务繁忙，请稍后再试") -> AdmissionRejected:
+        return AdmissionRejected(503, self._retry_after(), detail)
+
+    def _pop_waiter(self):
+        """取出优先级最高且仍在等待的请求"""
+        while self._queue:
+            future = heapq.heappop(self._queue)[2]
+            if not future.done():
+                return future
+        return None
+
+    def _evict_lowest(self, priority: int) -> bool:
+        """队列已满时，踢出优先级低于 priority 的最后一个等待请求"""
+        candidates = [entry for entry in self._queue if not entry[2].done() and entry[0] > priority]
+        if not candidates:
+            return False
+        victim = max(candidates)
+        victim[2].set_exception(self._overloaded("服务繁忙，低优先级请求已被丢弃"))
+        self._queue.remove(victim)
+        heapq.heapify(self._queue)
+        return True
+
+    def check_timeouts(self):
+        """让按 clock 计算已超时的等待请求失败（返回 503）"""
+        now = self.clock()
+        expired = False
+        for entry in self._queue:
+            future, deadline = entry[2], entry[3]
+            if not future.done() and deadline is not None and now >= deadline:
+                future.set_exception(self._overloaded("排队超时，请稍后再试"))
+                expired = True
+        if expired:
+            self._queue = [entry for entry in self._queue if not entry[2].done()]
+            heapq.heapify(self._queue)
+
+    def _schedule_timeout_check(self, future, deadline: float):
+        """在事件循环中安排超时检查，提前触发时按剩余时间重新安排"""
+        loop = asyncio.get_running_loop()
+
+        def on_timer():
+            if future.done():
+                return
+            self.check_timeouts()
+            if not future.done():
+                handle[0] = loop.call_later(max(deadline - self.clock(), 0.001), on_timer)
+
+        handle = [loop.call_later(max(deadline - self.clock(), 0), on_timer)]
+        return handle
+
+    async def _acquire_slot(self, priority: int):
+        self.check_timeouts()
+        if self.in_flight < self.max_in_flight and self.queued == 0:
+            self.in_flight += 1
+            return
+
+        if self.queued >= self.max_queue and not self._evict_lowest(priority):
+            raise self._overloaded()
+
+        future = asyncio.get_running_loop().create_future()
+        deadline = None if self.max_wait is None else self.clock() + self.max_wait
+        heapq.heappush(self._queue, (priority, next(self._counter), future, deadline))
+        timer = None if deadline is None else self._schedule_timeout_check(future, deadline)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                # 名额已经转交给本请求，需要归还
+                self._release_slot()
+            raise
+        finally:
+            if timer is not None:
+                timer[0].cancel()
+
+    def _release_slot(self):
+        waiter = self._pop_waiter()
+        if waiter is not None:
+            # 名额直接转交给下一个等待者，in_flight 保持不变
+            waiter.set_result(None)
+        else:
+            self.in_flight -= 1
+
+    def _record_service_time(self, elapsed: float):
+        self._avg_service_time = 0.8 * self._avg_service_time + 0.2 * elapsed
+
+    @asynccontextmanager
+    async def admit(self, client_id: str, priority: int = PRIORITY_INTERACTIVE, check_rate: bool = True):
+        """
+        准入一个识别请求
+        - 先检查客户端速率，再占用全局识别名额
+        - 被拒绝时抛出 AdmissionRejected
+        """
+        if check_rate:
+            self.check_rate(client_id)
+        await self._acquire_slot(priority)
+        started = self.clock()
+        try:
+            yield
+        finally:
+            self._record_service_time(self.clock() - started)
+            self._release_slot()
@@ -0,0 +1,191 @@
+"""
+饮食历史导出
+- 增量解析 metadata.json，每次只在内存中保留一条记录
+- 逐条生成 NDJSON / CSV 内容，可选gzip压缩
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+# 导出支持的字段（营养字段为 total_nutrition 中的数值）
+NUTRITION_KEYS = ["protein", "carbohydrates", "fat", "calories", "fiber", "sodium", "sugar"]
+EXPORT_FIELDS = [
+    "filename",
+    "original_name",
+    "upload_time",
+    "upload_date",
+    "file_size",
+    "content_type",
+    "success",
+    "food_name",
+    "description",
+    "estimated_weight",
+] + NUTRITION_KEYS
+
+EXPORT_FORMATS = ("ndjson", "csv")
+
+
+def select_fields(fields: Optional[str]) -> List[str]:
+    """解析逗号分隔的字段列表，未指定时返回全部字段，非法时抛出 ValueError"""
+    if fields is None:
+        return list(EXPORT_FIELDS)
+    selected = [field.strip() for field in fields.split(",") if field.strip()]
+    if not selected:
+        raise ValueError("未选择任何导出字段")
+    unknown = [field for field in selected if field not in EXPORT_FIELDS]
+    if unknown:
+        raise ValueError(f"未知字段: {', '.join(unknown)}")
+    return selected
+
+
+def validate_date(value: Optional[str]) -> Optional[str]:
+    """
+    校验日期并规范化为补零的 YYYY-MM-DD（如 2024-1-5 -> 2024-01-05），非法时抛出 ValueError
+    - 筛选时按字符串与 upload_date 比较，必须使用规范化后的值
+    """
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").strftime("%Y-%m-%d")
+    except ValueError:
+        raise ValueError(f"日期格式错误: {value}，应为 YYYY-MM-DD")
+
+
+def validate_date_range(start_date: Optional[str], end_date: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """校验并规范化日期范围，起始日期晚于结束日期时抛出 ValueError"""
+    start_date = validate_date(start_date)
+    end_date = validate_date(end_date)
+    if start_date and end_date and start_date > end_date:
+        raise ValueError(f"起始日期 {start_date} 晚于结束日期 {end_date}")
+    return start_date, end_date
+
+
+def iter_metadata(path: Path, chunk_size: int = 64 * 1024) -> Iterator[Tuple[str, dict]]:
+    """
+    增量解析元数据文件，逐条返回 (filename, info)
+    - 内存占用只与单条记录大小有关，与记录总数无关
+    - 记录按文件中的顺序（即上传顺序）返回
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buffer = ""
+        pos = 0
+        eof = False
+
+        def fill():
+            # 丢弃已解析的部分，再读入一块
+            nonlocal buffer, pos, eof
+            chunk = f.read(chunk_size)
+            if not chunk:
+                eof = True
+            buffer = buffer[pos:] + chunk
+            pos = 0
+
+        def skip_whitespace():
+            nonlocal pos
+            while True:
+                while pos < len(buffer) and buffer[pos].isspace():
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    return
+                fill()
+
+        def expect(chars: str) -> str:
+            skip_whitespace()
+            if pos >= len(buffer) or buffer[pos] not in chars:
+                raise ValueError(f"元数据格式错误: 期望 {chars!r}")
+            return buffer[pos]
+
+        def decode_value():
+            # 值后面必须还有字符（逗号或右括号），否则可能是被截断的数字
+            nonlocal pos
+            skip_whitespace()
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                    if end < len(buffer) or eof:
+                        pos = end
+                        return value
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                fill()
+
+        expect("{")
+        pos += 1
+        if expect('}"') == "}":
+            return
+        while True:
+            key = decode_value()
+            expect(":")
+            pos += 1
+            value = decode_value()
+            yield key, value
+            if expect(",}") == "}":
+                return
+            pos += 1
+
+
+def build_export_record(filename: str, info: dict) -> dict:
+    """将一条元数据展开为扁平的导出记录"""
+    food_rec = info.get("food_recognition", {}) or {}
+    total_nutrition = food_rec.get("total_nutrition", {}) or {}
+    record = {
+        "filename": filename,
+        "original_name": info.get("original_name"),
+        "upload_time": info.get("upload_time"),
+        "upload_date": info.get("upload_date"),
+        "file_size": info.get("file_size"),
+        "content_type": info.get("content_type"),
+        "success": bool(food_rec.get("success")),
+        "food_name": food_rec.get("food_name"),
+        "description": food_rec.get("description"),
+        "estimated_weight": food_rec.get("estimated_weight"),
+    }
+    for key in NUTRITION_KEYS:
+        record[key] = total_nutrition.get(key, 0)
+    return record
+
+
+def iter_export_rows(records, fields: list, fmt: str,
+                     start_date: Optional[str] = None, end_date: Optional[str] = None):
+    """
+    逐条生成导出内容（NDJSON 或 CSV）
+    - records: (filename, info) 的迭代器，通常来自 iter_metadata
+    - 日期范围包含边界，start_date / end_date 需先经过 validate_date 规范化
+    """
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+        yield buffer.getvalue()
+
+    for filename, info in records:
+        upload_date = info.get("upload_date", "")
+        if start_date and upload_date < start_date:
+            continue
+        if end_date and upload_date > end_date:
+            continue
+
+        record = build_export_record(filename, info)
+        if fmt == "csv":
+            buffer.seek(0)
+            buffer.truncate(0)
+            writer.writerow(["" if record[field] is None else record[field] for field in fields])
+            yield buffer.getvalue()
+        else:
+            yield json.dumps({field: record[field] for field in fields}, ensure_ascii=False) + "\n"
+
+
+def gzip_stream(chunks):
+    """以流的方式对生成器输出进行gzip压缩"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
@@ -1,14 +1,42 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Request
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from datetime import datetime, timezone, timedelta
 import os
 import json
+import asyncio
 from pathlib import Path
+from typing import Optional
 import base64
 from openai import OpenAI
 from dotenv import load_dotenv
 
+from storage import (
+    UPLOAD_DIR,
+    METADATA_FILE,
+    load_metadata,
+    save_metadata,
+    image_path,
+    resolve_image,
+    guess_content_type,
+    guess_extension,
+    parse_range,
+)
+from export import (
+    EXPORT_FORMATS,
+    select_fields,
+    validate_date_range,
+    iter_metadata,
+    iter_export_rows,
+    gzip_stream,
+)
+from admission import (
+    AdmissionController,
+    AdmissionRejected,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_BACKFILL,
+)
+
 # 加载环境变量
 load_dotenv()
 
@@ -20,6 +48,18 @@ client = OpenAI(
     base_url=os.getenv("OPENAI_BASE_URL", "https://yunwu.zeabur.app/v1")
 )
 
+# 识别请求的准入控制（限速、并发上限、排队）
+admission = AdmissionController(
+    max_in_flight=int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "4")),
+    max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "16")),
+    rate=float(os.getenv("RATE_LIMIT_PER_MINUTE", "10")) / 60,
+    burst=float(os.getenv("RATE_LIMIT_BURST", "5")),
+    max_wait=float(os.getenv("ADMISSION_MAX_WAIT", "30")),
+)
+
+# 反向代理写入客户端IP的请求头（为空表示直接使用连接的IP）
+TRUSTED_PROXY_HEADER = os.getenv("TRUSTED_PROXY_HEADER", "").strip()
+
 # 添加CORS中间件，允许前端跨域请求
 app.add_middleware(
     CORSMiddleware,
@@ -29,13 +69,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 设置上传文件保存路径
-UPLOAD_DIR = Path("uploads")
+# 创建上传目录（图片按哈希分片存放，见 storage.py）
 UPLOAD_DIR.mkdir(exist_ok=True)
 
-# 图片元数据文件路径
-METADATA_FILE = UPLOAD_DIR / "metadata.json"
-
 # 初始化元数据文件
 def init_metadata():
     if not METADATA_FILE.exists():
@@ -65,7 +101,9 @@ async def recognize_food_with_ai(image_path: str) -> dict:
             # 使用多模态API输入图片
             base64_image = encode_image_to_base64(image_path)
             
-            response = client.chat.completions.create(
+            # 在线程池中调用，避免阻塞事件循环，使并发上限生效
+            response = await asyncio.to_thread(
+                client.chat.completions.create,
                 model=model,
                 messages=[
                     {
@@ -245,99 +283,156 @@ async def recognize_food_with_ai(image_path: str) -> dict:
         }
 
 
-def load_metadata():
-    """加载图片元数据"""
-    with open(METADATA_FILE, 'r') as f:
-        return json.load(f)
-
-
-def save_metadata(metadata):
-    """保存图片元数据"""
-    with open(METADATA_FILE, 'w') as f:
-        json.dump(metadata, f, indent=2, ensure_ascii=False)
+def get_client_id(request: Request) -> str:
+    """
+    识别客户端，用于按客户端限速
+    - 使用连接的IP地址，不信任客户端自己提供的标识
+    - 部署在反向代理后时，可通过 TRUSTED_PROXY_HEADER（如 X-Forwarded-For）指定代理写入的请求头，
+      取其中最后一个地址（由代理追加，客户端无法伪造）
+    """
+    if TRUSTED_PROXY_HEADER:
+        forwarded = request.headers.get(TRUSTED_PROXY_HEADER)
+        if forwarded:
+            return forwarded.split(",")[-1].strip()
+    return request.client.host if request.client else "unknown"
 
 
 @app.post("/api/upload")
-async def upload_image(file: UploadFile = File(...)):
+async def upload_image(request: Request, file: UploadFile = File(...)):
     """
     上传图片接口
     - 接受图片文件
     - 自动记录上传时间
     - 返回图片ID和上传时间
+    - 受准入控制保护：超过速率返回429，服务繁忙返回503（均带 Retry-After）
+    - 请求头 X-Upload-Priority: backfill 表示批量补录，优先级低于交互式上传
     """
     try:
         # 验证文件类型
         if not file.content_type.startswith("image/"):
             raise HTTPException(status_code=400, detail="只支持图片文件")
-        
-        # 生成文件名（使用时间戳确保唯一性）
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-        file_extension = Path(file.filename).suffix
-        saved_filename = f"{timestamp}{file_extension}"
-        file_path = UPLOAD_DIR / saved_filename
-        
-        # 保存文件
-        contents = await file.read()
-        with open(file_path, "wb") as f:
-            f.write(contents)
-        
-        # 记录上传时间和文件信息（使用北京时间 UTC+8）
-        beijing_tz = timezone(timedelta(hours=8))
-        now = datetime.now(beijing_tz)
-        upload_time = now.isoformat()
-        upload_date = now.strftime("%Y-%m-%d")  # 添加日期字段便于筛选
-        metadata = load_metadata()
-        
-        # 使用AI识别食物
-        food_info = await recognize_food_with_ai(str(file_path))
-        
-        # 保存元数据
-        metadata[saved_filename] = {
-            "original_name": file.filename,
-            "upload_time": upload_time,
-            "upload_date": upload_date,
-            "file_size": len(contents),
-            "content_type": file.content_type,
-            "food_recognition": food_info
-        }
-        save_metadata(metadata)
-        
-        return {
-            "status": "success",
-            "filename": saved_filename,
-            "upload_time": upload_time,
-            "file_size": len(contents),
-            "food_recognition": food_info,
-            "message": "图片上传并识别成功" if food_info.get("success") else "图片上传成功，但食物识别失败"
-        }
-    
+
+        priority = PRIORITY_BACKFILL if request.headers.get("x-upload-priority", "").lower() == "backfill" else PRIORITY_INTERACTIVE
+
+        async with admission.admit(get_client_id(request), priority):
+            return await save_and_recognize(file)
+
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers={"Retry-After": str(e.retry_after)})
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"上传失败: {str(e)}")
 
 
+async def save_and_recognize(file: UploadFile) -> dict:
+    """保存上传的图片，识别食物并记录元数据"""
+    # 生成文件名（使用时间戳确保唯一性，扩展名与content type一致）
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    file_extension = guess_extension(file.filename, file.content_type)
+    saved_filename = f"{timestamp}{file_extension}"
+    file_path = image_path(saved_filename)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    
+    # 保存文件
+    contents = await file.read()
+    with open(file_path, "wb") as f:
+        f.write(contents)
+    
+    # 记录上传时间和文件信息（使用北京时间 UTC+8）
+    beijing_tz = timezone(timedelta(hours=8))
+    now = datetime.now(beijing_tz)
+    upload_time = now.isoformat()
+    upload_date = now.strftime("%Y-%m-%d")  # 添加日期字段便于筛选
+    
+    # 使用AI识别食物
+    food_info = await recognize_food_with_ai(str(file_path))
+    
+    # 保存元数据（识别完成后再读取，避免并发识别时覆盖其他请求写入的记录）
+    metadata = load_metadata()
+    metadata[saved_filename] = {
+        "original_name": file.filename,
+        "upload_time": upload_time,
+        "upload_date": upload_date,
+        "file_size": len(contents),
+        "content_type": file.content_type,
+        "food_recognition": food_info
+    }
+    save_metadata(metadata)
+    
+    return {
+        "status": "success",
+        "filename": saved_filename,
+        "upload_time": upload_time,
+        "file_size": len(contents),
+        "food_recognition": food_info,
+        "message": "图片上传并识别成功" if food_info.get("success") else "图片上传成功，但食物识别失败"
+    }
+
+
+def iter_file_range(file_path: Path, start: int, length: int, chunk_size: int = 64 * 1024):
+    """按块读取文件的指定区间"""
+    with open(file_path, "rb") as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
 @app.get("/api/image/{filename}")
-async def get_image(filename: str):
+async def get_image(filename: str, request: Request):
     """
     获取图片接口
     - 返回指定filename的图片
+    - 不读取元数据，content type 由扩展名推断
+    - 完整请求交给 FileResponse（服务器支持时走 sendfile），支持 Range 请求
     """
     try:
-        file_path = UPLOAD_DIR / filename
-        
-        # 检查文件是否存在
-        if not file_path.exists():
+        file_path = resolve_image(filename)
+
+        # 检查文件是否存在（resolve_image 已拒绝路径分隔符和元数据文件）
+        if file_path is None:
             raise HTTPException(status_code=404, detail="图片不存在")
-        
-        # 验证文件在上传目录内（安全检查）
-        if not file_path.resolve().is_relative_to(UPLOAD_DIR.resolve()):
-            raise HTTPException(status_code=403, detail="禁止访问")
-        
-        # 获取文件的content type
-        metadata = load_metadata()
-        content_type = metadata.get(filename, {}).get("content_type", "image/jpeg")
-        
-        return FileResponse(file_path, media_type=content_type)
-    
+
+        content_type = guess_content_type(filename)
+        stat_result = os.stat(file_path)
+        file_size = stat_result.st_size
+
+        range_header = request.headers.get("range")
+        try:
+            byte_range = parse_range(range_header, file_size) if range_header else None
+        except ValueError:
+            raise HTTPException(
+                status_code=416,
+                detail="请求范围无效",
+                headers={"Content-Range": f"bytes */{file_size}"},
+            )
+
+        if byte_range is None:
+            return FileResponse(
+                file_path,
+                media_type=content_type,
+                stat_result=stat_result,
+                headers={"Accept-Ranges": "bytes"},
+            )
+
+        start, end = byte_range
+        length = end - start + 1
+        return StreamingResponse(
+            iter_file_range(file_path, start, length),
+            status_code=206,
+            media_type=content_type,
+            headers={
+                "Accept-Ranges": "bytes",
+                "Content-Range": f"bytes {start}-{end}/{file_size}",
+                "Content-Length": str(length),
+            },
+        )
+
     except HTTPException:
         raise
     except Exception as e:
@@ -527,6 +622,51 @@ async def get_nutrition_summary():
         raise HTTPException(status_code=500, detail=f"获取营养汇总失败: {str(e)}")
 
 
+@app.get("/api/export")
+async def export_history(
+    format: str = Query("ndjson", description="导出格式: ndjson 或 csv"),
+    start_date: Optional[str] = Query(None, description="起始日期 YYYY-MM-DD（包含）"),
+    end_date: Optional[str] = Query(None, description="结束日期 YYYY-MM-DD（包含）"),
+    fields: Optional[str] = Query(None, description="逗号分隔的字段列表，默认导出全部字段"),
+    gzip: bool = Query(False, description="是否使用gzip压缩传输"),
+):
+    """
+    导出饮食历史与营养数据
+    - 以流式响应逐条输出记录，支持 NDJSON 和 CSV
+    - 增量解析 metadata.json，内存占用与历史记录数量无关
+    - 记录按上传顺序输出，可按日期范围筛选、选择导出字段
+    - 可选gzip压缩
+    """
+    try:
+        fmt = format.lower()
+        if fmt not in EXPORT_FORMATS:
+            raise HTTPException(status_code=400, detail="format 只支持 ndjson 或 csv")
+
+        try:
+            start_date, end_date = validate_date_range(start_date, end_date)
+            selected = select_fields(fields)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        # 逐条读取元数据，避免一次性加载整个文件
+        rows = iter_export_rows(iter_metadata(METADATA_FILE), selected, fmt, start_date, end_date)
+
+        media_type = "text/csv; charset=utf-8" if fmt == "csv" else "application/x-ndjson; charset=utf-8"
+        export_name = f"food_history.{'csv' if fmt == 'csv' else 'ndjson'}"
+        headers = {"Content-Disposition": f'attachment; filename="{export_name}"'}
+
+        if gzip:
+            headers["Content-Encoding"] = "gzip"
+            return StreamingResponse(gzip_stream(rows), media_type=media_type, headers=headers)
+
+        return StreamingResponse(rows, media_type=media_type, headers=headers)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"导出失败: {str(e)}")
+
+
 @app.get("/")
 async def root():
     """根路由"""
@@ -539,7 +679,8 @@ async def root():
             "list_images": "GET /api/images - 获取所有图片列表",
             "get_metadata": "GET /api/image/{filename}/metadata - 获取图片元数据（包括食物识别信息）",
             "daily_nutrition": "GET /api/nutrition/daily/{date} - 获取指定日期的总营养（日期格式: YYYY-MM-DD）",
-            "nutrition_summary": "GET /api/nutrition/summary - 获取最近7天的营养汇总"
+            "nutrition_summary": "GET /api/nutrition/summary - 获取最近7天的营养汇总",
+            "export": "GET /api/export - 流式导出饮食历史与营养数据（NDJSON/CSV）"
         }
     }
 
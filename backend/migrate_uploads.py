@@ -0,0 +1,53 @@
+"""
+迁移脚本 - 将 uploads/ 下扁平存放的图片移动到哈希分片目录
+用法:
+    python migrate_uploads.py            # 执行迁移
+    python migrate_uploads.py --dry-run  # 只打印将要移动的文件
+可以重复执行，已迁移的文件会被跳过
+"""
+import argparse
+import os
+from pathlib import Path
+
+from storage import UPLOAD_DIR, is_safe_filename, image_path
+
+
+def migrate(base_dir: Path = UPLOAD_DIR, dry_run: bool = False) -> dict:
+    """移动扁平布局中的图片，返回统计信息"""
+    stats = {"moved": 0, "skipped": 0}
+
+    with os.scandir(base_dir) as entries:
+        for entry in entries:
+            # 跳过分片目录和元数据文件（包括保存时的临时文件）
+            if not entry.is_file() or not is_safe_filename(entry.name):
+                continue
+
+            target = image_path(entry.name, base_dir)
+            if target.exists():
+                print(f"跳过（目标已存在）: {entry.name}")
+                stats["skipped"] += 1
+                continue
+
+            print(f"{entry.name} -> {target.relative_to(base_dir)}")
+            if not dry_run:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(entry.path, target)
+            stats["moved"] += 1
+
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="将上传图片迁移到哈希分片目录")
+    parser.add_argument("--dir", default=str(UPLOAD_DIR), help="上传目录（默认 uploads）")
+    parser.add_argument("--dry-run", action="store_true", help="只打印，不移动文件")
+    args = parser.parse_args()
+
+    base_dir = Path(args.dir)
+    if not base_dir.is_dir():
+        print(f"错误: 目录不存在 {base_dir}")
+    else:
+        result = migrate(base_dir, dry_run=args.dry_run)
+        print("=" * 50)
+        print(f"迁移完成: 移动 {result['moved']} 个文件，跳过 {result['skipped']} 个文件")
+        print("=" * 50)
@@ -0,0 +1,149 @@
+"""
+图片存储布局
+- 按文件名哈希分片存放图片，避免单个目录下文件过多
+- 例如 20231219_120530_123456.jpg -> uploads/3f/a2/20231219_120530_123456.jpg
+"""
+import hashlib
+import json
+import mimetypes
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+# 设置上传文件保存路径
+UPLOAD_DIR = Path("uploads")
+
+# 图片元数据文件路径
+METADATA_FILE = UPLOAD_DIR / "metadata.json"
+
+DEFAULT_CONTENT_TYPE = "image/jpeg"
+
+# mimetypes 可能不认识的常见图片扩展名
+EXTRA_IMAGE_EXTENSIONS = {".heic", ".heif", ".webp", ".avif"}
+
+
+def load_metadata(path: Path = METADATA_FILE) -> dict:
+    """加载图片元数据"""
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_metadata(metadata: dict, path: Path = METADATA_FILE):
+    """
+    保存图片元数据
+    - 先写入同目录下的临时文件，再用 os.replace 原子替换
+    - 正在读取旧文件的导出等操作会继续读到完整的旧内容
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(metadata, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def is_image_extension(suffix: str) -> bool:
+    """判断扩展名是否为图片"""
+    suffix = suffix.lower()
+    if suffix in EXTRA_IMAGE_EXTENSIONS:
+        return True
+    content_type, _ = mimetypes.guess_type(f"x{suffix}")
+    return bool(content_type) and content_type.startswith("image/")
+
+
+def is_safe_filename(filename: str) -> bool:
+    """
+    文件名只能是单个路径组成部分，防止目录遍历
+    - 元数据文件及其保存时的临时文件不能通过图片接口访问
+    - 不限制扩展名：旧版本按原始扩展名保存，可能没有扩展名
+    """
+    if not filename or filename in (".", "..") or "/" in filename or "\\" in filename:
+        return False
+    if filename == METADATA_FILE.name or filename.startswith(f".{METADATA_FILE.name}."):
+        return False
+    return True
+
+
+def shard_dir(filename: str, base_dir: Path = UPLOAD_DIR) -> Path:
+    """根据文件名哈希计算两级分片目录（ab/cd）"""
+    digest = hashlib.md5(filename.encode("utf-8")).hexdigest()
+    return base_dir / digest[:2] / digest[2:4]
+
+
+def image_path(filename: str, base_dir: Path = UPLOAD_DIR) -> Path:
+    """图片在分片布局中的存放路径"""
+    return shard_dir(filename, base_dir) / filename
+
+
+def legacy_image_path(filename: str, base_dir: Path = UPLOAD_DIR) -> Path:
+    """迁移前的扁平布局路径"""
+    return base_dir / filename
+
+
+def guess_content_type(filename: str) -> str:
+    """根据扩展名推断content type，无需读取元数据"""
+    content_type, _ = mimetypes.guess_type(filename)
+    if content_type and content_type.startswith("image/"):
+        return content_type
+    return DEFAULT_CONTENT_TYPE
+
+
+def guess_extension(original_name: Optional[str], content_type: str) -> str:
+    """
+    确定保存时使用的扩展名
+    - 优先使用原始文件名的扩展名
+    - 否则根据content type推断，保证之后可以从文件名推断content type
+    """
+    suffix = Path(original_name or "").suffix.lower()
+    if suffix and mimetypes.guess_type(f"x{suffix}")[0] == content_type:
+        return suffix
+    guessed = mimetypes.guess_extension(content_type or "")
+    if guessed and is_image_extension(guessed):
+        return ".jpg" if guessed in (".jpe", ".jpeg") else guessed
+    if suffix and is_image_extension(suffix):
+        return suffix
+    return ".jpg"
+
+
+def resolve_image(filename: str, base_dir: Path = UPLOAD_DIR) -> Optional[Path]:
+    """查找图片实际路径，兼容尚未迁移的扁平布局"""
+    if not is_safe_filename(filename):
+        return None
+    for candidate in (image_path(filename, base_dir), legacy_image_path(filename, base_dir)):
+        if candidate.is_file():
+            return candidate
+    return None
+
+
+def parse_range(range_header: str, file_size: int):
+    """
+    解析单段 Range 请求头（bytes=start-end）
+    - 返回 (start, end)，end 为包含的结束位置
+    - 不支持的格式（多段、非bytes单位）返回 None，按完整文件返回
+    - 范围无法满足时抛出 ValueError
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    start_str, _, end_str = spec.strip().partition("-")
+    try:
+        if start_str:
+            start = int(start_str)
+            end = int(end_str) if end_str else file_size - 1
+        else:
+            # bytes=-N 表示最后N个字节
+            suffix_length = int(end_str)
+            if suffix_length <= 0:
+                raise ValueError("空的后缀范围")
+            start = max(file_size - suffix_length, 0)
+            end = file_size - 1
+    except ValueError:
+        raise ValueError(f"无效的Range: {range_header}")
+    if start < 0 or start >= file_size or end < start:
+        raise ValueError(f"无效的Range: {range_header}")
+    return start, min(end, file_size - 1)
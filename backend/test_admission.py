@@ -0,0 +1,259 @@
+"""
+测试脚本 - 准入控制（不需要启动服务器，使用假时钟）
+运行: python test_admission.py 或 python -m pytest test_admission.py
+"""
+
+import asyncio
+
+from admission import (
+    AdmissionController,
+    AdmissionRejected,
+    TokenBucket,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_BACKFILL,
+)
+
+
+class FakeClock:
+    """可手动推进的假时钟"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+def test_token_bucket():
+    """测试令牌桶的突发和补充"""
+    clock = FakeClock()
+    bucket = TokenBucket(rate=1, capacity=2, clock=clock)
+
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == 1
+
+    clock.advance(0.5)
+    assert bucket.try_acquire() == 0.5
+
+    clock.advance(0.5)
+    assert bucket.try_acquire() == 0
+
+    clock.advance(100)
+    assert bucket.is_full()
+
+
+def test_rate_limit_per_client():
+    """测试每个客户端独立限速，超限返回 429 和 Retry-After"""
+    clock = FakeClock()
+    controller = AdmissionController(rate=0.5, burst=2, clock=clock)
+
+    controller.check_rate("a")
+    controller.check_rate("a")
+    try:
+        controller.check_rate("a")
+        assert False, "应该被限速"
+    except AdmissionRejected as e:
+        assert e.status_code == 429
+        assert e.retry_after == 2
+
+    # 其他客户端不受影响
+    controller.check_rate("b")
+
+    clock.advance(2)
+    controller.check_rate("a")
+
+
+def test_in_flight_cap_and_queue_shedding():
+    """测试全局并发上限和队列满时快速返回 503"""
+    clock = FakeClock()
+    controller = AdmissionController(max_in_flight=1, max_queue=1, max_wait=None, burst=100, clock=clock)
+
+    async def scenario():
+        release = asyncio.Event()
+        order = []
+
+        async def job(name):
+            async with controller.admit(name):
+                order.append(name)
+                await release.wait()
+
+        first = asyncio.ensure_future(job("first"))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(job("second"))
+        await asyncio.sleep(0)
+
+        assert controller.in_flight == 1
+        assert controller.queued == 1
+
+        # 队列已满，第三个请求立即被拒绝
+        try:
+            async with controller.admit("third"):
+                pass
+            assert False, "应该被拒绝"
+        except AdmissionRejected as e:
+            assert e.status_code == 503
+            assert e.retry_after >= 1
+
+        release.set()
+        await asyncio.gather(first, second)
+        assert order == ["first", "second"]
+        assert controller.in_flight == 0
+        assert controller.queued == 0
+
+    asyncio.run(scenario())
+
+
+def test_interactive_priority_over_backfill():
+    """测试交互式请求优先，队列满时丢弃低优先级请求"""
+    controller = AdmissionController(max_in_flight=1, max_queue=2, max_wait=None, burst=100, clock=FakeClock())
+
+    async def scenario():
+        release = asyncio.Event()
+        order = []
+
+        async def job(name, priority):
+            async with controller.admit(name, priority):
+                order.append(name)
+                await release.wait()
+
+        running = asyncio.ensure_future(job("running", PRIORITY_INTERACTIVE))
+        await asyncio.sleep(0)
+        backfill_1 = asyncio.ensure_future(job("backfill_1", PRIORITY_BACKFILL))
+        backfill_2 = asyncio.ensure_future(job("backfill_2", PRIORITY_BACKFILL))
+        await asyncio.sleep(0)
+        interactive = asyncio.ensure_future(job("interactive", PRIORITY_INTERACTIVE))
+        await asyncio.sleep(0)
+
+        # 队列已满，最后进入的 backfill 请求被丢弃
+        results = await asyncio.gather(backfill_2, return_exceptions=True)
+        assert isinstance(results[0], AdmissionRejected)
+        assert results[0].status_code == 503
+
+        release.set()
+        await asyncio.gather(running, backfill_1, interactive)
+        assert order == ["running", "interactive", "backfill_1"]
+        assert controller.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_queue_wait_timeout():
+    """测试排队超时按假时钟计算，超时返回 503"""
+    clock = FakeClock()
+    controller = AdmissionController(max_in_flight=1, max_queue=4, max_wait=30, burst=100, clock=clock)
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def hold():
+            async with controller.admit("holder"):
+                await release.wait()
+
+        async def wait():
+            async with controller.admit("waiter"):
+                pass
+
+        holder = asyncio.ensure_future(hold())
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(wait())
+        await asyncio.sleep(0)
+        assert controller.queued == 1
+
+        # 未到期限时不会超时
+        clock.advance(29)
+        controller.check_timeouts()
+        await asyncio.sleep(0)
+        assert not waiter.done()
+
+        clock.advance(1)
+        controller.check_timeouts()
+        results = await asyncio.gather(waiter, return_exceptions=True)
+        assert isinstance(results[0], AdmissionRejected)
+        assert results[0].status_code == 503
+        assert controller.queued == 0
+
+        release.set()
+        await holder
+        assert controller.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_expired_waiters_checked_on_admit():
+    """测试新请求进入时也会清理已超时的等待请求"""
+    clock = FakeClock()
+    controller = AdmissionController(max_in_flight=1, max_queue=1, max_wait=30, burst=100, clock=clock)
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def job(name):
+            async with controller.admit(name):
+                await release.wait()
+
+        holder = asyncio.ensure_future(job("holder"))
+        await asyncio.sleep(0)
+        stale = asyncio.ensure_future(job("stale"))
+        await asyncio.sleep(0)
+
+        # 队列已满，但排队的请求已经超时，新请求可以进入队列
+        clock.advance(31)
+        fresh = asyncio.ensure_future(job("fresh"))
+        await asyncio.sleep(0)
+        assert isinstance((await asyncio.gather(stale, return_exceptions=True))[0], AdmissionRejected)
+        assert controller.queued == 1
+
+        release.set()
+        await asyncio.gather(holder, fresh)
+        assert controller.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_client_buckets_lru_cap():
+    """测试令牌桶数量有上限，淘汰最久未使用的客户端"""
+    clock = FakeClock()
+    controller = AdmissionController(rate=0, burst=1, max_tracked_clients=2, clock=clock)
+
+    controller.check_rate("a")
+    controller.check_rate("b")
+    # 访问 a 使其成为最近使用
+    try:
+        controller.check_rate("a")
+    except AdmissionRejected:
+        pass
+    controller.check_rate("c")
+
+    assert list(controller._buckets) == ["a", "c"]
+    # a 的桶仍然保留，仍被限速
+    try:
+        controller.check_rate("a")
+        assert False, "应该被限速"
+    except AdmissionRejected as e:
+        assert e.status_code == 429
+
+    for i in range(100):
+        controller.check_rate(f"rotating-{i}")
+    assert len(controller._buckets) == 2
+
+
+if __name__ == "__main__":
+    print("开始测试准入控制...\n")
+    for test in [
+        test_token_bucket,
+        test_rate_limit_per_client,
+        test_in_flight_cap_and_queue_shedding,
+        test_interactive_priority_over_backfill,
+        test_queue_wait_timeout,
+        test_expired_waiters_checked_on_admit,
+        test_client_buckets_lru_cap,
+    ]:
+        test()
+        print(f"✅ {test.__doc__}")
+    print("\n" + "=" * 50)
+    print("测试完成！")
+    print("=" * 50)
@@ -0,0 +1,221 @@
+"""
+测试脚本 - 饮食历史导出（不需要启动服务器）
+运行: python test_export.py 或 python -m pytest test_export.py
+"""
+
+import csv
+import gzip
+import io
+import json
+import tempfile
+from pathlib import Path
+
+from export import (
+    EXPORT_FIELDS,
+    select_fields,
+    validate_date,
+    validate_date_range,
+    iter_metadata,
+    iter_export_rows,
+    gzip_stream,
+)
+from storage import save_metadata
+
+METADATA = {
+    "20240101_080000_000000.jpg": {
+        "original_name": "breakfast.jpg",
+        "upload_time": "2024-01-01T08:00:00+08:00",
+        "upload_date": "2024-01-01",
+        "file_size": 100,
+        "content_type": "image/jpeg",
+        "food_recognition": {
+            "success": True,
+            "food_name": "包子, 豆浆",
+            "description": "早餐",
+            "estimated_weight": 200,
+            "total_nutrition": {"protein": 12.5, "calories": 300},
+        },
+    },
+    "20240102_120000_000000.png": {
+        "original_name": "lunch.png",
+        "upload_time": "2024-01-02T12:00:00+08:00",
+        "upload_date": "2024-01-02",
+        "file_size": 200,
+        "content_type": "image/png",
+        "food_recognition": {"success": False, "error": "未识别到食物"},
+    },
+    "20240103_190000_000000.jpg": {
+        "original_name": "dinner.jpg",
+        "upload_time": "2024-01-03T19:00:00+08:00",
+        "upload_date": "2024-01-03",
+        "file_size": 300,
+        "content_type": "image/jpeg",
+        "food_recognition": {
+            "success": True,
+            "food_name": "米饭",
+            "estimated_weight": 150,
+            "total_nutrition": {"protein": 3.9, "calories": 174},
+        },
+    },
+}
+
+
+def write_metadata(metadata, indent=2) -> Path:
+    path = Path(tempfile.mkdtemp()) / "metadata.json"
+    path.write_text(json.dumps(metadata, indent=indent, ensure_ascii=False), encoding="utf-8")
+    return path
+
+
+def export(fmt, fields=None, start_date=None, end_date=None):
+    records = iter_metadata(write_metadata(METADATA))
+    return "".join(iter_export_rows(records, select_fields(fields), fmt, start_date, end_date))
+
+
+def test_iter_metadata_incremental():
+    """测试增量解析元数据，结果与 json.load 一致（包括很小的读取块）"""
+    for indent in (None, 2):
+        path = write_metadata(METADATA, indent)
+        for chunk_size in (1, 7, 64 * 1024):
+            assert list(iter_metadata(path, chunk_size)) == list(METADATA.items())
+
+    assert list(iter_metadata(write_metadata({}))) == []
+
+
+def test_ndjson_export():
+    """测试 NDJSON 导出，每行一条完整记录"""
+    lines = export("ndjson").splitlines()
+    assert len(lines) == 3
+
+    first = json.loads(lines[0])
+    assert list(first.keys()) == EXPORT_FIELDS
+    assert first["filename"] == "20240101_080000_000000.jpg"
+    assert first["food_name"] == "包子, 豆浆"
+    assert first["protein"] == 12.5
+    assert first["fat"] == 0
+
+    second = json.loads(lines[1])
+    assert second["success"] is False
+    assert second["food_name"] is None
+
+
+def test_csv_export():
+    """测试 CSV 导出，首行为表头并正确转义"""
+    rows = list(csv.reader(io.StringIO(export("csv"))))
+    assert rows[0] == EXPORT_FIELDS
+    assert len(rows) == 4
+
+    record = dict(zip(rows[0], rows[1]))
+    assert record["food_name"] == "包子, 豆浆"
+    assert record["calories"] == "300"
+    assert dict(zip(rows[0], rows[2]))["food_name"] == ""
+
+
+def test_date_range_inclusive():
+    """测试日期范围包含起止日期"""
+    lines = export("ndjson", start_date="2024-01-02", end_date="2024-01-03").splitlines()
+    assert [json.loads(line)["upload_date"] for line in lines] == ["2024-01-02", "2024-01-03"]
+
+    lines = export("ndjson", start_date="2024-01-02", end_date="2024-01-02").splitlines()
+    assert [json.loads(line)["upload_date"] for line in lines] == ["2024-01-02"]
+
+    assert export("ndjson", start_date="2024-01-04") == ""
+
+
+def test_field_selection():
+    """测试字段选择"""
+    lines = export("ndjson", fields="filename, calories").splitlines()
+    assert json.loads(lines[0]) == {"filename": "20240101_080000_000000.jpg", "calories": 300}
+
+    rows = list(csv.reader(io.StringIO(export("csv", fields="food_name,upload_date"))))
+    assert rows[0] == ["food_name", "upload_date"]
+    assert rows[3] == ["米饭", "2024-01-03"]
+
+
+def test_invalid_parameters():
+    """测试非法字段和日期返回明确的错误（接口中转为 400）"""
+    for fields, message in [("calories,unknown", "未知字段: unknown"), (",", "未选择任何导出字段"), ("", "未选择任何导出字段")]:
+        try:
+            select_fields(fields)
+            assert False, "应该抛出 ValueError"
+        except ValueError as e:
+            assert str(e) == message
+
+    for value in ("2024-13-01", "2024/01/01", "yesterday"):
+        try:
+            validate_date(value)
+            assert False, "应该抛出 ValueError"
+        except ValueError as e:
+            assert value in str(e)
+
+    assert validate_date("2024-01-01") == "2024-01-01"
+    assert validate_date(None) is None
+
+    try:
+        validate_date_range("2024-01-03", "2024-01-01")
+        assert False, "应该抛出 ValueError"
+    except ValueError as e:
+        assert "晚于" in str(e)
+
+
+def test_unpadded_dates_normalized():
+    """测试未补零的日期被规范化后再筛选"""
+    assert validate_date("2024-1-5") == "2024-01-05"
+    assert validate_date_range("2024-1-2", "2024-1-2") == ("2024-01-02", "2024-01-02")
+
+    records = [
+        ("a.jpg", {"upload_date": "2024-01-10"}),
+        ("b.jpg", {"upload_date": "2024-02-01"}),
+    ]
+    start_date, end_date = validate_date_range("2024-1-5", "2024-1-31")
+    lines = list(iter_export_rows(iter(records), ["filename"], "ndjson", start_date, end_date))
+    assert [json.loads(line)["filename"] for line in lines] == ["a.jpg"]
+
+
+def test_gzip_stream():
+    """测试gzip压缩后解压得到相同的内容"""
+    for fmt in ("ndjson", "csv"):
+        plain = export(fmt)
+        records = iter_metadata(write_metadata(METADATA))
+        compressed = b"".join(gzip_stream(iter_export_rows(records, EXPORT_FIELDS, fmt)))
+        assert gzip.decompress(compressed).decode("utf-8") == plain
+
+
+def test_export_during_metadata_rewrite():
+    """测试导出过程中元数据被重写时，导出仍读取完整的旧快照"""
+    original = {
+        f"2024010{i % 9 + 1}_{i:06d}.jpg": {"upload_date": f"2024-01-0{i % 9 + 1}", "file_size": i}
+        for i in range(500)
+    }
+    path = write_metadata(original)
+
+    rows = iter_export_rows(iter_metadata(path, chunk_size=256), ["filename", "file_size"], "ndjson")
+    exported = [next(rows) for _ in range(100)]
+
+    # 模拟上传接口在导出中途保存元数据（内容变少，旧文件如被原地截断会导致解析失败）
+    save_metadata({"new.jpg": {"upload_date": "2024-02-01"}}, path)
+    exported.extend(rows)
+
+    assert [json.loads(line)["filename"] for line in exported] == list(original)
+    assert json.loads(path.read_text(encoding="utf-8")) == {"new.jpg": {"upload_date": "2024-02-01"}}
+    # 没有遗留临时文件
+    assert [p.name for p in path.parent.iterdir()] == ["metadata.json"]
+
+
+if __name__ == "__main__":
+    print("开始测试导出...\n")
+    for test in [
+        test_iter_metadata_incremental,
+        test_ndjson_export,
+        test_csv_export,
+        test_date_range_inclusive,
+        test_field_selection,
+        test_invalid_parameters,
+        test_unpadded_dates_normalized,
+        test_gzip_stream,
+        test_export_during_metadata_rewrite,
+    ]:
+        test()
+        print(f"✅ {test.__doc__}")
+    print("\n" + "=" * 50)
+    print("测试完成！")
+    print("=" * 50)
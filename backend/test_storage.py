@@ -0,0 +1,158 @@
+"""
+测试脚本 - 图片分片存储、Range 解析和迁移（不需要启动服务器）
+运行: python test_storage.py 或 python -m pytest test_storage.py
+"""
+
+import tempfile
+from pathlib import Path
+
+from storage import (
+    is_safe_filename,
+    image_path,
+    resolve_image,
+    guess_content_type,
+    guess_extension,
+    parse_range,
+)
+from migrate_uploads import migrate
+
+
+def make_upload_dir() -> Path:
+    base_dir = Path(tempfile.mkdtemp()) / "uploads"
+    base_dir.mkdir()
+    (base_dir / "metadata.json").write_text("{}")
+    return base_dir
+
+
+def assert_unsatisfiable(range_header, file_size=10):
+    try:
+        parse_range(range_header, file_size)
+        assert False, f"应该返回 416: {range_header}"
+    except ValueError:
+        pass
+
+
+def test_parse_range():
+    """测试 Range 解析的边界情况"""
+    assert parse_range("bytes=0-9", 10) == (0, 9)
+    assert parse_range("bytes=2-4", 10) == (2, 4)
+    # 开放结尾
+    assert parse_range("bytes=5-", 10) == (5, 9)
+    # 最后N个字节
+    assert parse_range("bytes=-3", 10) == (7, 9)
+    assert parse_range("bytes=-100", 10) == (0, 9)
+    # 结尾超出文件大小时截断
+    assert parse_range("bytes=8-999", 10) == (8, 9)
+
+
+def test_parse_range_unsatisfiable():
+    """测试无法满足的范围（接口返回 416）"""
+    for range_header in ["bytes=10-", "bytes=100-200", "bytes=5-2", "bytes=-0", "bytes=abc", "bytes=1-x"]:
+        assert_unsatisfiable(range_header)
+    assert_unsatisfiable("bytes=0-", file_size=0)
+
+
+def test_parse_range_fallback_to_full():
+    """测试多段范围和非bytes单位返回 None，按完整文件返回"""
+    assert parse_range("bytes=0-1,3-4", 10) is None
+    assert parse_range("items=0-1", 10) is None
+
+
+def test_is_safe_filename():
+    """测试文件名检查"""
+    assert is_safe_filename("20240101_080000_000000.jpg")
+    assert is_safe_filename("photo.PNG")
+    assert is_safe_filename("photo.heic")
+    # 旧版本上传的无扩展名图片
+    assert is_safe_filename("20240101_080000_000000")
+
+    for filename in ["", ".", "..", "a/b.jpg", "..\\a.jpg", "metadata.json", ".metadata.json.abc123.tmp"]:
+        assert not is_safe_filename(filename), filename
+
+
+def test_resolve_image():
+    """测试优先查找分片路径，兼容扁平路径，拒绝不安全的文件名"""
+    base_dir = make_upload_dir()
+
+    sharded = image_path("sharded.jpg", base_dir)
+    sharded.parent.mkdir(parents=True)
+    sharded.write_bytes(b"a")
+    assert resolve_image("sharded.jpg", base_dir) == sharded
+
+    legacy = base_dir / "legacy.jpg"
+    legacy.write_bytes(b"b")
+    assert resolve_image("legacy.jpg", base_dir) == legacy
+
+    # 旧版本保存的无扩展名图片
+    extensionless = base_dir / "20240101_080000_000000"
+    extensionless.write_bytes(b"c")
+    assert resolve_image("20240101_080000_000000", base_dir) == extensionless
+    assert guess_content_type("20240101_080000_000000") == "image/jpeg"
+
+    assert resolve_image("missing.jpg", base_dir) is None
+    assert resolve_image("..", base_dir) is None
+    assert resolve_image("a/b", base_dir) is None
+    assert resolve_image("metadata.json", base_dir) is None
+
+
+def test_content_type_and_extension():
+    """测试 content type 由扩展名推断，保存时的扩展名与 content type 一致"""
+    assert guess_content_type("a.png") == "image/png"
+    assert guess_content_type("a.jpg") == "image/jpeg"
+    assert guess_content_type("a.unknown") == "image/jpeg"
+    assert guess_content_type("noext") == "image/jpeg"
+
+    assert guess_extension("photo.JPG", "image/jpeg") == ".jpg"
+    assert guess_extension("blob", "image/png") == ".png"
+    assert guess_extension("photo.png", "image/jpeg") == ".jpg"
+    assert guess_extension("notes.txt", "image/x-unknown") == ".jpg"
+
+
+def test_migrate():
+    """测试迁移：移动无扩展名的旧图片，跳过元数据文件，可重复执行"""
+    base_dir = make_upload_dir()
+    (base_dir / "a.jpg").write_bytes(b"a")
+    (base_dir / "b.png").write_bytes(b"b")
+    (base_dir / "20240101_080000_000000").write_bytes(b"c")
+    (base_dir / ".metadata.json.abc123.tmp").write_text("{}")
+
+    assert migrate(base_dir) == {"moved": 3, "skipped": 0}
+    assert (base_dir / ".metadata.json.abc123.tmp").exists()
+    assert image_path("20240101_080000_000000", base_dir).read_bytes() == b"c"
+    assert (base_dir / "metadata.json").read_text() == "{}"
+    assert not (base_dir / "a.jpg").exists()
+    assert image_path("a.jpg", base_dir).read_bytes() == b"a"
+    assert image_path("b.png", base_dir).read_bytes() == b"b"
+
+    # 再次执行不会移动任何文件
+    assert migrate(base_dir) == {"moved": 0, "skipped": 0}
+    assert resolve_image("a.jpg", base_dir) == image_path("a.jpg", base_dir)
+
+
+def test_migrate_dry_run():
+    """测试 dry run 不移动文件"""
+    base_dir = make_upload_dir()
+    (base_dir / "a.jpg").write_bytes(b"a")
+
+    assert migrate(base_dir, dry_run=True) == {"moved": 1, "skipped": 0}
+    assert (base_dir / "a.jpg").exists()
+    assert not image_path("a.jpg", base_dir).exists()
+
+
+if __name__ == "__main__":
+    print("开始测试图片存储...\n")
+    for test in [
+        test_parse_range,
+        test_parse_range_unsatisfiable,
+        test_parse_range_fallback_to_full,
+        test_is_safe_filename,
+        test_resolve_image,
+        test_content_type_and_extension,
+        test_migrate,
+        test_migrate_dry_run,
+    ]:
+        test()
+        print(f"✅ {test.__doc__}")
+    print("\n" + "=" * 50)
+    print("测试完成！")
+    print("=" * 50)